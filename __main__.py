@@ -12,20 +12,37 @@ config_kinesis = pulumi.Config("kinesis")    # Kinesis configuration
 config_elasticache = pulumi.Config("elasticache")  # ElastiCache configuration
 config_ingestion = pulumi.Config("ingestion")      # Ingestion schedule configuration
 
+# Static IAM policy documents
+LAMBDA_ASSUME_ROLE_POLICY = json.dumps({
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Principal": {
+                "Service": "lambda.amazonaws.com"
+            },
+            "Action": "sts:AssumeRole"
+        }
+    ]
+})
+
+ELASTICACHE_POLICY = json.dumps({
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Effect": "Allow",
+            "Action": [
+                "elasticache:DescribeReplicationGroups",
+                "elasticache:DescribeCacheClusters"
+            ],
+            "Resource": "*"
+        }
+    ]
+})
+
 # Create IAM role for Lambda functions
 lambda_role = aws.iam.Role("lambda-role",
-    assume_role_policy=json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Principal": {
-                    "Service": "lambda.amazonaws.com"
-                },
-                "Action": "sts:AssumeRole"
-            }
-        ]
-    })
+    assume_role_policy=LAMBDA_ASSUME_ROLE_POLICY
 )
 
 # Attach basic execution policy to Lambda role
@@ -45,9 +62,16 @@ kinesis_stream = aws.kinesis.Stream("bavest-data-stream",
     }
 )
 
+# Enhanced fan-out consumer so the processing Lambda gets dedicated
+# per-shard throughput and records pushed over HTTP/2 instead of polling
+kinesis_consumer = aws.kinesis.StreamConsumer("bavest-efo-consumer",
+    name="bavest-efo-consumer",
+    stream_arn=kinesis_stream.arn
+)
+
 # IAM policy for Kinesis access
 kinesis_policy = aws.iam.Policy("kinesis-policy",
-    policy=pulumi.Output.all(kinesis_stream.arn).apply(lambda args: json.dumps({
+    policy=kinesis_stream.arn.apply(lambda stream_arn: json.dumps({
         "Version": "2012-10-17",
         "Statement": [
             {
@@ -58,16 +82,28 @@ kinesis_policy = aws.iam.Policy("kinesis-policy",
                     "kinesis:GetRecords",
                     "kinesis:GetShardIterator",
                     "kinesis:DescribeStream",
+                    "kinesis:DescribeStreamSummary",
+                    "kinesis:ListShards",
                     "kinesis:ListStreams"
                 ],
-                "Resource": args[0]
+                "Resource": stream_arn
+            },
+            {
+                "Effect": "Allow",
+                "Action": [
+                    "kinesis:SubscribeToShard",
+                    "kinesis:DescribeStreamConsumer"
+                ],
+                # Any consumer registered on this stream, so the document
+                # only depends on the stream ARN
+                "Resource": f"{stream_arn}/consumer/*"
             }
         ]
     }))
 )
 
 # Attach Kinesis policy to Lambda role
-aws.iam.RolePolicyAttachment("lambda-kinesis-policy",
+kinesis_policy_attachment = aws.iam.RolePolicyAttachment("lambda-kinesis-policy",
     role=lambda_role.name,
     policy_arn=kinesis_policy.arn
 )
@@ -83,6 +119,13 @@ default_subnets = aws.ec2.get_subnets(filters=[
     }
 ])
 
+# Default subnets grouped by AZ, used to co-locate the processing Lambda
+# with the Redis node
+subnets_by_az = {}
+for subnet_id in default_subnets.ids:
+    subnet = aws.ec2.get_subnet(id=subnet_id)
+    subnets_by_az.setdefault(subnet.availability_zone, []).append(subnet_id)
+
 # Create ElastiCache subnet group with default subnets
 elasticache_subnet_group = aws.elasticache.SubnetGroup("bavest-cache-subnet-group",
     name="bavest-cache-subnet-group",
@@ -114,13 +157,14 @@ elasticache_security_group = aws.ec2.SecurityGroup("elasticache-sg",
 )
 
 # ElastiCache Redis cluster
+num_cache_clusters = config_elasticache.get_int("num_cache_clusters") or 1
 redis_cluster = aws.elasticache.ReplicationGroup("bavest-redis-cluster",
     description="Redis cluster for Bavest financial data",
     replication_group_id="bavest-redis",
     node_type=config_elasticache.get("node_type") or "cache.t3.micro",
     port=6379,
     parameter_group_name="default.redis7",
-    num_cache_clusters=config_elasticache.get_int("num_cache_clusters") or 1,
+    num_cache_clusters=num_cache_clusters,
     subnet_group_name=elasticache_subnet_group.name,
     security_group_ids=[elasticache_security_group.id],
     tags={
@@ -129,21 +173,20 @@ redis_cluster = aws.elasticache.ReplicationGroup("bavest-redis-cluster",
     }
 )
 
+# With a single Redis node, keep the processing Lambda in that node's actual
+# AZ so the hot path to Redis never crosses AZs. With replicas the primary can
+# fail over to another AZ, so the Lambda stays spread across all subnets.
+if num_cache_clusters == 1:
+    redis_az = aws.elasticache.get_cluster_output(
+        cluster_id=redis_cluster.member_clusters[0]
+    ).availability_zone
+    processing_subnet_ids = redis_az.apply(lambda az: subnets_by_az[az])
+else:
+    processing_subnet_ids = default_subnets.ids
+
 # IAM policy for ElastiCache access
 elasticache_policy = aws.iam.Policy("elasticache-policy",
-    policy=json.dumps({
-        "Version": "2012-10-17",
-        "Statement": [
-            {
-                "Effect": "Allow",
-                "Action": [
-                    "elasticache:DescribeReplicationGroups",
-                    "elasticache:DescribeCacheClusters"
-                ],
-                "Resource": "*"
-            }
-        ]
-    })
+    policy=ELASTICACHE_POLICY
 )
 
 # Attach ElastiCache policy to Lambda role
@@ -175,6 +218,7 @@ ingestion_lambda = aws.lambda_.Function("bavest-ingestion-lambda",
         }
     },
     timeout=config_lambda.get_int("timeout") or 30,
+    memory_size=config_lambda.get_int("ingestion_memory") or 1024,
     tags={
         "Environment": config.get("environment") or "dev",
         "Purpose": "bavest-ingestion"
@@ -220,7 +264,7 @@ processing_lambda = aws.lambda_.Function("bavest-processing-lambda",
         }
     },
     vpc_config={
-        "subnet_ids": default_subnets.ids,
+        "subnet_ids": processing_subnet_ids,
         "security_group_ids": [elasticache_security_group.id]
     },
     timeout=config_lambda.get_int("processing_timeout") or 60,
@@ -232,14 +276,21 @@ processing_lambda = aws.lambda_.Function("bavest-processing-lambda",
 
 # Event source mapping for Kinesis to Lambda
 aws.lambda_.EventSourceMapping("kinesis-lambda-mapping",
-    event_source_arn=kinesis_stream.arn,
+    event_source_arn=kinesis_consumer.arn,
     function_name=processing_lambda.arn,
-    starting_position="LATEST"
+    starting_position="LATEST",
+    batch_size=config_kinesis.get_int("batch_size") or 500,
+    maximum_batching_window_in_seconds=config_kinesis.get_int("batch_window") or 30,
+    parallelization_factor=config_kinesis.get_int("parallelization_factor") or 2,
+    maximum_retry_attempts=3,
+    # The role must be able to subscribe to the consumer before the mapping is created
+    opts=pulumi.ResourceOptions(depends_on=[kinesis_policy_attachment])
 )
 
 # Export important values
 pulumi.export("kinesis_stream_name", kinesis_stream.name)
 pulumi.export("kinesis_stream_arn", kinesis_stream.arn)
+pulumi.export("kinesis_consumer_arn", kinesis_consumer.arn)
 pulumi.export("redis_primary_endpoint", redis_cluster.primary_endpoint_address)
 pulumi.export("ingestion_lambda_name", ingestion_lambda.name)
 pulumi.export("processing_lambda_name", processing_lambda.name)
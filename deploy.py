@@ -8,8 +8,21 @@ This script helps deploy the Lambda dependencies and infrastructure.
 import os
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+# Wheel cache shared by all Lambda installs and reused across runs
+PIP_CACHE_DIR = Path(__file__).resolve().parent / ".pip-cache"
+
+# The Lambdas run python3.11 on x86_64, so binary wheels (orjson, msgpack,
+# zstandard) are fetched for that target rather than the local interpreter
+LAMBDA_PLATFORM_ARGS = [
+    "--platform", "manylinux2014_x86_64",
+    "--implementation", "cp",
+    "--python-version", "3.11",
+    "--only-binary=:all:"
+]
+
 def run_command(command, cwd=None):
     """Run a shell command and return the result."""
     try:
@@ -31,22 +44,54 @@ def install_lambda_dependencies():
         "lambda_functions/processing"
     ]
     
-    for lambda_dir in lambda_dirs:
-        if os.path.exists(lambda_dir):
-            print(f"Installing dependencies for {lambda_dir}...")
-            requirements_file = os.path.join(lambda_dir, "requirements.txt")
-            if os.path.exists(requirements_file):
-                command = f"pip install -r requirements.txt -t ."
-                if not run_command(command, cwd=lambda_dir):
-                    print(f"Failed to install dependencies for {lambda_dir}")
-                    return False
-            else:
-                print(f"No requirements.txt found in {lambda_dir}")
-        else:
-            print(f"Lambda directory {lambda_dir} does not exist")
-            
+    # Install all Lambda directories concurrently
+    with ThreadPoolExecutor(max_workers=len(lambda_dirs)) as executor:
+        results = list(executor.map(install_one_lambda, lambda_dirs))
+    
+    report_pip_cache()
+    
+    return all(results)
+
+def install_one_lambda(lambda_dir):
+    """Install the dependencies for a single Lambda directory."""
+    if not os.path.exists(lambda_dir):
+        print(f"Lambda directory {lambda_dir} does not exist")
+        return True
+    
+    requirements_file = os.path.join(lambda_dir, "requirements.txt")
+    if not os.path.exists(requirements_file):
+        print(f"No requirements.txt found in {lambda_dir}")
+        return True
+    
+    print(f"Installing dependencies for {lambda_dir}...")
+    command = [
+        sys.executable, "-m", "pip", "install",
+        "--cache-dir", str(PIP_CACHE_DIR),
+        *LAMBDA_PLATFORM_ARGS,
+        "-r", "requirements.txt",
+        "-t", "."
+    ]
+    try:
+        result = subprocess.run(command, cwd=lambda_dir, capture_output=True, text=True)
+    except Exception as e:
+        print(f"Exception installing dependencies for {lambda_dir}: {e}")
+        return False
+    
+    if result.returncode != 0:
+        print(f"Failed to install dependencies for {lambda_dir}")
+        print(f"Error output: {result.stderr}")
+        return False
+    
     return True
 
+def report_pip_cache():
+    """Print the size of the shared pip cache."""
+    if not PIP_CACHE_DIR.exists():
+        return
+    
+    size = sum(f.stat().st_size for f in PIP_CACHE_DIR.rglob("*") if f.is_file())
+    print(f"pip cache at {PIP_CACHE_DIR}: {size / (1024 * 1024):.1f} MB")
+
 def deploy_infrastructure():
     """Deploy the Pulumi infrastructure."""
     print("Deploying infrastructure...")
@@ -6,11 +6,18 @@ It's triggered by EventBridge on a scheduled basis (every 5 minutes by default).
 """
 
 import json
+import orjson
+import msgpack
 import boto3
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
-from datetime import datetime
+import time
+from datetime import datetime, timezone
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
 # Configure logging
 logger = logging.getLogger()
@@ -19,6 +26,59 @@ logger.setLevel(logging.INFO)
 # Initialize AWS clients
 kinesis = boto3.client('kinesis')
 
+# Kinesis PutRecords limits
+KINESIS_MAX_RECORDS_PER_REQUEST = 500
+KINESIS_MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+KINESIS_PUT_MAX_ATTEMPTS = 3
+KINESIS_RETRY_BACKOFF_SECONDS = 0.1
+
+# Configuration read once per cold start
+BAVEST_API_URL = os.environ.get('BAVEST_API_URL')
+BAVEST_API_KEY = os.environ.get('BAVEST_API_KEY')
+KINESIS_STREAM_NAME = os.environ.get('KINESIS_STREAM_NAME')
+ENV_CONFIGURED = all([BAVEST_API_URL, BAVEST_API_KEY, KINESIS_STREAM_NAME])
+
+# ISINs fetched from the Bavest API on every run
+BAVEST_ISINS = ("DE0005104400",)
+
+# Kinesis payloads are msgpack prefixed with a format version byte, which
+# lets the processing function tell them apart from legacy JSON records
+PAYLOAD_FORMAT_MSGPACK = b'\x01'
+
+# Thread pool for fanning out Bavest requests and PutRecords calls. boto3
+# clients are thread-safe; requests does not document Session as such, so
+# workers only read the shared session (its headers are set before fan-out)
+# and rely on urllib3's thread-safe connection pool
+MAX_WORKERS = 8
+_EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+
+# (connect, read) timeout for each Bavest request. With up to 3 attempts and
+# backoff this stays well inside the 30 s function timeout.
+BAVEST_TIMEOUT_SECONDS = (3, 5)
+
+# HTTP session reused across invocations so warm containers keep the
+# TLS connection to the Bavest API alive
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=MAX_WORKERS,
+    max_retries=Retry(
+        total=2,
+        # One read retry covers a reset on a reused keep-alive connection,
+        # which urllib3 counts as a read error
+        read=1,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        # A long Retry-After would sleep past the function timeout
+        respect_retry_after_header=False,
+        allowed_methods=frozenset(['POST'])  # The quote endpoint is read-only
+    )
+))
+_SESSION.headers.update({
+    'accept': 'application/json',
+    'content-type': 'application/json',
+})
+
 def handler(event, context):
     """
     Main Lambda handler function
@@ -33,27 +93,22 @@ def handler(event, context):
     try:
         logger.info("Starting Bavest API ingestion")
         
-        # Get environment variables
-        bavest_api_url = os.environ.get('BAVEST_API_URL')
-        api_key = os.environ.get('BAVEST_API_KEY')
-        kinesis_stream_name = os.environ.get('KINESIS_STREAM_NAME')
-        
-        if not all([bavest_api_url, api_key, kinesis_stream_name]):
+        if not ENV_CONFIGURED:
             raise ValueError("Missing required environment variables")
         
         # Fetch data from Bavest API
-        bavest_data = fetch_bavest_signals(bavest_api_url, api_key)
+        bavest_data = fetch_bavest_signals(BAVEST_API_URL, BAVEST_API_KEY)
         
         # Send to Kinesis
-        kinesis_response = send_to_kinesis(bavest_data, kinesis_stream_name)
+        kinesis_response = send_to_kinesis(bavest_data, KINESIS_STREAM_NAME)
         
-        logger.info(f"Successfully processed {len(bavest_data) if isinstance(bavest_data, list) else 1} records")
+        logger.info(f"Successfully processed {len(kinesis_response)} records")
         
         return {
             'statusCode': 200,
             'body': json.dumps({
                 'message': 'Data successfully ingested and sent to Kinesis',
-                'records_processed': len(bavest_data) if isinstance(bavest_data, list) else 1,
+                'records_processed': len(kinesis_response),
                 'kinesis_sequence_numbers': kinesis_response
             })
         }
@@ -69,107 +124,232 @@ def handler(event, context):
         }
 
 
-def fetch_bavest_signals(api_url, api_key):
+def fetch_bavest_signals(api_url, api_key, isins=BAVEST_ISINS):
     """
     Fetch financial signals from Bavest API
     
+    Quotes for multiple ISINs are fetched concurrently.
+    
     Args:
         api_url (str): Bavest API endpoint URL
         api_key (str): API authentication key
+        isins (tuple): ISINs to fetch quotes for
+        
+    Returns:
+        dict: API response data (dict or list) keyed by ISIN
+    """
+    # Set the auth header once per execution environment rather than per call
+    if _SESSION.headers.get('x-api-key') != api_key:
+        _SESSION.headers['x-api-key'] = api_key
+    
+    logger.info(f"Fetching data from: {api_url}")
+    
+    if len(isins) == 1:
+        return {isins[0]: fetch_bavest_quote(api_url, isins[0])}
+    
+    return dict(zip(isins, _EXECUTOR.map(partial(fetch_bavest_quote, api_url), isins)))
+
+
+def fetch_bavest_quote(api_url, isin):
+    """
+    Fetch the quote for a single ISIN from Bavest API
+    
+    Args:
+        api_url (str): Bavest API endpoint URL
+        isin (str): ISIN to fetch the quote for
         
     Returns:
         dict or list: API response data
     """
     payload = {
-        "isin": "DE0005104400"
-    }
-    headers = {
-        'x-api-key': api_key,
-        'accept': 'application/json',
-        'content-type': 'application/json',
+        "isin": isin
     }
     
-    logger.info(f"Fetching data from: {api_url}")
-    
     try:
-        response = requests.post(f'{api_url}/quote', json=payload, headers=headers, timeout=25)
+        response = _SESSION.post(f'{api_url}/quote', json=payload, timeout=BAVEST_TIMEOUT_SECONDS)
         response.raise_for_status()
         
-        data = response.json()
-        logger.info(f"Successfully fetched data from Bavest API")
+        try:
+            data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            # Input orjson rejects but requests' decoder accepts (NaN/Infinity
+            # literals, a UTF-8 BOM, non-UTF-8 encodings)
+            data = response.json()
+        logger.info(f"Successfully fetched data from Bavest API for {isin}")
         
         return data
         
     except requests.exceptions.Timeout:
-        logger.error("Request to Bavest API timed out")
+        logger.error(f"Request to Bavest API timed out for {isin}")
         raise
     except requests.exceptions.RequestException as e:
-        logger.error(f"Request to Bavest API failed: {str(e)}")
+        logger.error(f"Request to Bavest API failed for {isin}: {str(e)}")
         raise
     except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse JSON response: {str(e)}")
+        logger.error(f"Failed to parse JSON response for {isin}: {str(e)}")
         raise
 
 
-def send_to_kinesis(data, stream_name):
+def send_to_kinesis(quotes, stream_name, now_iso=None):
     """
-    Send data to Kinesis stream
+    Send data to Kinesis stream using batched PutRecords calls
+    
+    Each record carries its ISIN, which is also used as the partition key.
     
     Args:
-        data (dict or list): Data to send to Kinesis
+        quotes (dict): API response data (dict or list) keyed by ISIN
         stream_name (str): Name of the Kinesis stream
+        now_iso (str): Ingestion timestamp shared by all records (defaults to now)
         
     Returns:
         list: List of sequence numbers from Kinesis responses
     """
     sequence_numbers = []
     
-    # Ensure data is a list for consistent processing
-    if not isinstance(data, list):
-        data = [data]
-    
-    for record in data:
-        # Add metadata
-        enriched_record = {
-            'data': record,
-            'ingestion_timestamp': datetime.utcnow().isoformat(),
-            'source': 'bavest_api',
-            'lambda_request_id': os.environ.get('AWS_REQUEST_ID', 'unknown')
-        }
-        
-        # Determine partition key (use a fixed key since we're querying specific ISIN)
-        partition_key = "DE0005104400"  # The ISIN we're querying
+    if now_iso is None:
+        now_iso = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+    
+    request_id = os.environ.get('AWS_REQUEST_ID', 'unknown')
+    
+    entries = []
+    for isin, data in quotes.items():
+        # Ensure data is a list for consistent processing
+        if not isinstance(data, list):
+            data = [data]
         
-        try:
-            response = kinesis.put_record(
-                StreamName=stream_name,
-                Data=json.dumps(enriched_record),
-                PartitionKey=partition_key
-            )
-            
-            sequence_numbers.append(response['SequenceNumber'])
-            logger.info(f"Sent record to Kinesis with sequence number: {response['SequenceNumber']}")
+        for record in data:
+            # Add metadata
+            enriched_record = {
+                'data': record,
+                'isin': isin,
+                'ingestion_timestamp': now_iso,
+                'source': 'bavest_api',
+                'lambda_request_id': request_id
+            }
             
-        except Exception as e:
-            logger.error(f"Failed to send record to Kinesis: {str(e)}")
-            raise
+            entries.append({
+                'Data': PAYLOAD_FORMAT_MSGPACK + msgpack.packb(enriched_record, use_bin_type=True, datetime=True),
+                'PartitionKey': isin
+            })
+    
+    # Submit independent runs of chunks concurrently; chunks sharing a partition
+    # key stay in one run so an ISIN's records reach the stream in order.
+    # Results come back in chunk order.
+    put_run = partial(put_chunks_serially, stream_name=stream_name)
+    try:
+        for run_sequence_numbers in _EXECUTOR.map(put_run, group_chunks_by_partition_key(chunk_kinesis_entries(entries))):
+            sequence_numbers.extend(run_sequence_numbers)
+    except Exception as e:
+        logger.error(f"Failed to send records to Kinesis: {str(e)}")
+        raise
     
     return sequence_numbers
 
 
-def validate_bavest_data(data):
+def chunk_kinesis_entries(entries, max_records=KINESIS_MAX_RECORDS_PER_REQUEST,
+                          max_bytes=KINESIS_MAX_BYTES_PER_REQUEST):
     """
-    Validate the structure of data received from Bavest API
+    Split PutRecords entries into chunks that respect the Kinesis request limits
     
     Args:
-        data (dict or list): Data to validate
+        entries (list): PutRecords entries with 'Data' and 'PartitionKey'
+        max_records (int): Maximum number of records per request
+        max_bytes (int): Maximum payload size (data + partition keys) per request
+        
+    Yields:
+        list: A chunk of entries suitable for a single PutRecords call
+    """
+    chunk = []
+    chunk_bytes = 0
+    
+    for entry in entries:
+        entry_bytes = len(entry['Data']) + len(entry['PartitionKey'].encode('utf-8'))
+        if chunk and (len(chunk) >= max_records or chunk_bytes + entry_bytes > max_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(entry)
+        chunk_bytes += entry_bytes
+    
+    if chunk:
+        yield chunk
+
+
+def group_chunks_by_partition_key(chunks):
+    """
+    Group consecutive chunks that share a partition key into runs
+    
+    Entries are built ISIN by ISIN, so an ISIN split across chunks always
+    spans the boundary between neighbouring chunks.
+    
+    Args:
+        chunks (iterable): PutRecords chunks in submission order
+        
+    Returns:
+        list: Runs of chunks that must be submitted one after another
+    """
+    runs = []
+    for chunk in chunks:
+        if runs and runs[-1][-1][-1]['PartitionKey'] == chunk[0]['PartitionKey']:
+            runs[-1].append(chunk)
+        else:
+            runs.append([chunk])
+    
+    return runs
+
+
+def put_chunks_serially(chunks, stream_name):
+    """
+    Submit a run of chunks one PutRecords request at a time
+    
+    Args:
+        chunks (list): Chunks of PutRecords entries
+        stream_name (str): Name of the Kinesis stream
         
     Returns:
-        bool: True if data is valid
-    """
-    if isinstance(data, list):
-        return all(isinstance(item, dict) for item in data)
-    elif isinstance(data, dict):
-        return True
-    else:
-        return False
+        list: Sequence numbers in the same order as the submitted entries
+    """
+    sequence_numbers = []
+    for chunk in chunks:
+        sequence_numbers.extend(put_records_with_retry(chunk, stream_name))
+    
+    return sequence_numbers
+
+
+def put_records_with_retry(entries, stream_name, max_attempts=KINESIS_PUT_MAX_ATTEMPTS):
+    """
+    Submit a chunk of entries via PutRecords, retrying only the failed entries
+    
+    Args:
+        entries (list): PutRecords entries for a single request
+        stream_name (str): Name of the Kinesis stream
+        max_attempts (int): Maximum number of PutRecords attempts
+        
+    Returns:
+        list: Sequence numbers in the same order as the submitted entries
+    """
+    sequence_numbers = [None] * len(entries)
+    pending = list(range(len(entries)))
+    
+    for attempt in range(1, max_attempts + 1):
+        response = kinesis.put_records(
+            StreamName=stream_name,
+            Records=[entries[i] for i in pending]
+        )
+        
+        retry = []
+        for index, result in zip(pending, response['Records']):
+            if result.get('ErrorCode'):
+                retry.append(index)
+            else:
+                sequence_numbers[index] = result['SequenceNumber']
+        
+        logger.info(f"Sent {len(pending) - len(retry)} records to Kinesis (attempt {attempt}, failed: {response.get('FailedRecordCount', 0)})")
+        
+        if not retry:
+            return sequence_numbers
+        
+        pending = retry
+        time.sleep(KINESIS_RETRY_BACKOFF_SECONDS * 2 ** (attempt - 1))
+    
+    raise RuntimeError(f"Failed to send {len(pending)} records to Kinesis after {max_attempts} attempts")
@@ -6,18 +6,67 @@ and stores the results in Redis (ElastiCache).
 """
 
 import json
+import orjson
+import msgpack
+import zstandard
 import boto3
 import redis
 import os
 import base64
-from datetime import datetime
+import bisect
+import math
+import time
+from datetime import datetime, timezone
 import logging
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple, Collection
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Redis client reused across invocations within the same execution environment
+_REDIS = None
+
+# Last (current_price, pe_ratio) written per symbol by this execution environment.
+# Other environments write the same keys, so a match is only a hint that is
+# confirmed against Redis before a write is skipped. Entries are refreshed before
+# the shortest key TTL (15 min) expires and the cache is bounded since warm
+# containers are reused across many invocations.
+_LAST_WRITTEN: Dict[str, Tuple[Tuple[Any, Any], float]] = {}
+_LAST_WRITTEN_MAX_SIZE = 1024
+_LAST_WRITTEN_REFRESH_SECONDS = 600
+
+# Compressor for the full processed payload written to Redis
+_ZSTD = zstandard.ZstdCompressor(level=3)
+
+# Default ISIN for records that don't carry one (Bavest quote responses have
+# no symbol; the ingestion function adds the ISIN to its envelope)
+BAVEST_ISIN = "DE0005104400"
+
+# Version byte prefixed to msgpack Kinesis payloads; anything else is JSON
+PAYLOAD_FORMAT_MSGPACK = b'\x01'
+
+# P/E thresholds for categorization and valuation signals. Each bound starts
+# the next bucket; the first bound is the smallest positive float so that
+# P/E <= 0 falls into the negative earnings bucket.
+_POSITIVE = math.nextafter(0.0, 1.0)
+_PE_BOUNDS = (_POSITIVE, 10, 15, 25, 50)
+_PE_CATEGORIES = (
+    'negative_earnings',
+    'undervalued',
+    'fair_value',
+    'growth_stock',
+    'expensive',
+    'highly_speculative'
+)
+_SIGNAL_BOUNDS = (_POSITIVE, 15, 25)
+_SIGNALS = (
+    'avoid',  # Negative earnings
+    'buy',    # Potentially undervalued
+    'hold',   # Fair value
+    'sell'    # Potentially overvalued
+)
+
 def handler(event, context):
     """
     Main Lambda handler function for processing Kinesis records
@@ -28,28 +77,62 @@ def handler(event, context):
         
     Returns:
         dict: Response with processing results
+        
+    Raises:
+        Exception: On infrastructure failures (e.g. Redis unavailable), so
+            the batch is redelivered; per-record errors are only reported
     """
     try:
         logger.info(f"Processing {len(event['Records'])} Kinesis records")
         
-        # Initialize Redis connection
+        # One timestamp for every record in this invocation
+        now_iso = utc_now_iso()
+        
+        # Get (or lazily create) the shared Redis connection
         redis_client = get_redis_client()
         
         processed_records = []
         failed_records = []
         
+        # Phase 1: decode all records
+        decoded_records = []
         for record in event['Records']:
             try:
-                # Process individual record
-                processed_data = process_kinesis_record(record, redis_client)
+                decoded_records.append((record, decode_kinesis_record(record)))
+            except Exception as e:
+                record_failure(failed_records, record, e)
+        
+        # Phase 2: analyze all records, keeping only the latest observation per symbol
+        latest_by_symbol = {}
+        for record, (symbol, data) in decoded_records:
+            try:
+                processed_data = perform_analysis(data, now_iso=now_iso, symbol=symbol)
                 processed_records.append(processed_data)
-                
+                previous = latest_by_symbol.get(processed_data['symbol'])
+                if previous is None or not is_older_observation(processed_data, previous[1]):
+                    latest_by_symbol[processed_data['symbol']] = (record, processed_data)
             except Exception as e:
-                logger.error(f"Failed to process record: {str(e)}")
-                failed_records.append({
-                    'record_id': record.get('eventID', 'unknown'),
-                    'error': str(e)
-                })
+                record_failure(failed_records, record, e)
+        
+        # Phase 3: queue writes for the whole batch on one pipeline and flush once.
+        # A failing execute() propagates so the whole batch is retried.
+        unchanged = unchanged_in_redis(
+            [processed_data for _, processed_data in latest_by_symbol.values()],
+            redis_client
+        )
+        queued = []
+        with redis_client.pipeline(transaction=False) as pipe:
+            for record, processed_data in latest_by_symbol.values():
+                try:
+                    if store_in_redis(processed_data, pipe, unchanged):
+                        queued.append(processed_data)
+                except Exception as e:
+                    record_failure(failed_records, record, e)
+            pipe.execute()
+        
+        # Only remember fingerprints once the writes are known to be stored
+        for processed_data in queued:
+            remember_last_write(processed_data)
         
         logger.info(f"Successfully processed {len(processed_records)} records, failed: {len(failed_records)}")
         
@@ -64,23 +147,27 @@ def handler(event, context):
         }
         
     except Exception as e:
+        # Re-raise so the event source mapping retries the batch instead of
+        # checkpointing past records that were never stored
         logger.error(f"Critical error in processing: {str(e)}")
-        return {
-            'statusCode': 500,
-            'body': json.dumps({
-                'error': str(e),
-                'message': 'Critical failure in data processing'
-            })
-        }
+        raise
 
 
 def get_redis_client():
     """
-    Initialize and return Redis client
+    Return the Redis client for this execution environment, creating it on first use
+    
+    The client and its connection pool live at module scope so that warm
+    invocations reuse the existing connection instead of reconnecting.
     
     Returns:
         redis.Redis: Configured Redis client
     """
+    global _REDIS
+    
+    if _REDIS is not None:
+        return _REDIS
+    
     redis_host = os.environ.get('REDIS_HOST')
     redis_port = int(os.environ.get('REDIS_PORT', 6379))
     
@@ -88,18 +175,23 @@ def get_redis_client():
         raise ValueError("REDIS_HOST environment variable not set")
     
     try:
-        client = redis.Redis(
-            host=redis_host, 
-            port=redis_port, 
-            decode_responses=True,
+        # Responses are left as bytes so compressed values round-trip
+        pool = redis.ConnectionPool(
+            host=redis_host,
+            port=redis_port,
+            max_connections=4,
             socket_timeout=5,
-            socket_connect_timeout=5
+            socket_connect_timeout=5,
+            socket_keepalive=True,
+            health_check_interval=30
         )
+        client = redis.Redis(connection_pool=pool)
         
         # Test connection
         client.ping()
         logger.info(f"Successfully connected to Redis at {redis_host}:{redis_port}")
         
+        _REDIS = client
         return client
         
     except redis.ConnectionError as e:
@@ -107,51 +199,81 @@ def get_redis_client():
         raise
 
 
-def process_kinesis_record(record: Dict, redis_client: redis.Redis) -> Dict:
+def utc_now_iso() -> str:
     """
-    Process a single Kinesis record
+    Return the current UTC time as an ISO 8601 string with millisecond precision
+    
+    Returns:
+        str: Timestamp such as 2024-01-01T12:00:00.000+00:00
+    """
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+
+def decode_kinesis_record(record: Dict) -> Tuple[str, Dict]:
+    """
+    Decode a single Kinesis record into the Bavest payload
+    
+    Payloads are msgpack with a version byte prefix; JSON payloads from
+    older producers (or manual test events) are still accepted.
     
     Args:
         record: Kinesis record
-        redis_client: Redis client instance
         
     Returns:
-        dict: Processed data
+        tuple: ISIN from the ingestion envelope (BAVEST_ISIN if absent) and
+            the Bavest data with the ingestion metadata removed
     """
-    # Decode Kinesis data
     kinesis_data = record['kinesis']
-    payload = base64.b64decode(kinesis_data['data']).decode('utf-8')
-    data = json.loads(payload)
+    payload = base64.b64decode(kinesis_data['data'])
     
-    logger.info(f"Processing record with partition key: {kinesis_data.get('partitionKey', 'unknown')}")
-    
-    # Extract the actual data (remove ingestion metadata)
-    bavest_data = data.get('data', data)
+    if payload[:1] == PAYLOAD_FORMAT_MSGPACK:
+        data = msgpack.unpackb(payload[1:], raw=False, timestamp=3)
+    else:
+        # Records written before the switch to msgpack
+        data = orjson.loads(payload)
     
-    # Perform data science processing
-    processed_data = perform_analysis(bavest_data)
+    logger.info(f"Decoded record with partition key: {kinesis_data.get('partitionKey', 'unknown')}")
     
-    # Store in Redis
-    store_in_redis(processed_data, redis_client)
+    # Extract the actual data (remove ingestion metadata)
+    return data.get('isin') or BAVEST_ISIN, data.get('data', data)
+
+
+def record_failure(failed_records: List[Dict], record: Dict, error: Exception) -> None:
+    """
+    Log a failed record and add it to the failure list
     
-    return processed_data
+    Args:
+        failed_records: List of failures reported in the handler response
+        record: Kinesis record that failed
+        error: Exception raised while handling the record
+    """
+    logger.error(f"Failed to process record: {str(error)}")
+    failed_records.append({
+        'record_id': record.get('eventID', 'unknown'),
+        'error': str(error)
+    })
 
 
-def perform_analysis(data: Dict) -> Dict:
+def perform_analysis(data: Dict, now_iso: Optional[str] = None, symbol: Optional[str] = None) -> Dict:
     """
     Perform simplified P/E ratio analysis on Bavest API data
     
     Args:
         data: Raw financial data from Bavest API
+        now_iso: Processing timestamp shared by the batch (defaults to now)
+        symbol: ISIN the data belongs to (defaults to BAVEST_ISIN)
         
     Returns:
         dict: Processed data with P/E ratio and additional metrics
     """
+    if now_iso is None:
+        now_iso = utc_now_iso()
+    
     processed = {
-        'symbol': extract_symbol_from_data(data),
-        'timestamp': datetime.utcnow().isoformat(),
+        'symbol': symbol or BAVEST_ISIN,
+        'timestamp': now_iso,
         'original_data': data,
-        'processing_timestamp': datetime.utcnow().isoformat(),
+        'processing_timestamp': now_iso,
         'analytics': {},
         'market_data': {},
         'metadata': {
@@ -212,6 +334,29 @@ def perform_analysis(data: Dict) -> Dict:
     return processed
 
 
+def is_older_observation(processed_data: Dict, other: Dict) -> bool:
+    """
+    Check whether a record was observed before another one for the same symbol
+    
+    Kinesis does not guarantee the order of records within a PutRecords
+    request, so the Bavest timestamp decides; records without comparable
+    timestamps keep their batch order.
+    
+    Args:
+        processed_data: Processed record to check
+        other: Processed record it is compared with
+        
+    Returns:
+        bool: True if processed_data is the older observation
+    """
+    timestamp = processed_data['metadata'].get('data_timestamp')
+    other_timestamp = other['metadata'].get('data_timestamp')
+    try:
+        return timestamp is not None and other_timestamp is not None and timestamp < other_timestamp
+    except TypeError:
+        return False
+
+
 def get_valuation_signal(pe_ratio: float) -> str:
     """
     Generate a simple valuation signal based on P/E ratio
@@ -222,14 +367,7 @@ def get_valuation_signal(pe_ratio: float) -> str:
     Returns:
         str: Valuation signal (buy/hold/sell)
     """
-    if pe_ratio <= 0:
-        return 'avoid'  # Negative earnings
-    elif pe_ratio < 15:
-        return 'buy'    # Potentially undervalued
-    elif pe_ratio < 25:
-        return 'hold'   # Fair value
-    else:
-        return 'sell'   # Potentially overvalued
+    return _SIGNALS[bisect.bisect_right(_SIGNAL_BOUNDS, pe_ratio)]
 
 
 def calculate_pe_ratio(data: Dict) -> Optional[float]:
@@ -289,42 +427,138 @@ def categorize_pe_ratio(pe_ratio: float) -> str:
     Returns:
         str: Category description
     """
-    if pe_ratio <= 0:
-        return 'negative_earnings'
-    elif pe_ratio < 10:
-        return 'undervalued'
-    elif pe_ratio < 15:
-        return 'fair_value'
-    elif pe_ratio < 25:
-        return 'growth_stock'
-    elif pe_ratio < 50:
-        return 'expensive'
-    else:
-        return 'highly_speculative'
+    return _PE_CATEGORIES[bisect.bisect_right(_PE_BOUNDS, pe_ratio)]
 
 
-def extract_symbol_from_data(data: Dict) -> str:
+def store_in_redis(processed_data: Dict, redis_client: redis.Redis,
+                   unchanged: Collection[str] = ()) -> bool:
     """
-    Extract trading symbol from Bavest API response
+    Store processed Bavest P/E ratio data in Redis with appropriate keys and TTL
+    
+    Writes are skipped for symbols in unchanged, i.e. those whose price and
+    P/E ratio were confirmed to match Redis by unchanged_in_redis. All
+    commands are sent through a non-transactional pipeline. When a pipeline
+    is passed in, the commands are queued on it and the caller is responsible
+    for executing it and then calling remember_last_write; otherwise a
+    pipeline is created and flushed here.
     
     Args:
-        data: Financial data dictionary from Bavest API
+        processed_data: Processed financial data with P/E ratio from Bavest
+        redis_client: Redis client or pipeline instance
+        unchanged: Symbols whose stored values already match
         
     Returns:
-        Trading symbol or ISIN
+        bool: True if writes were queued or stored, False if skipped
     """
-    # For Bavest API, we'll use the ISIN from the ingestion metadata
-    # or fall back to a default ISIN
-    return "DE0005104400"  # The ISIN we're tracking
+    if processed_data['symbol'] in unchanged:
+        logger.info(f"Skipping Redis write for {processed_data['symbol']} - price and P/E unchanged")
+        return False
+    
+    if isinstance(redis_client, redis.client.Pipeline):
+        queue_redis_writes(processed_data, redis_client)
+        return True
+    
+    with redis_client.pipeline(transaction=False) as pipe:
+        queue_redis_writes(processed_data, pipe)
+        pipe.execute()
+    
+    remember_last_write(processed_data)
+    return True
 
 
-def store_in_redis(processed_data: Dict, redis_client: redis.Redis) -> None:
+def unchanged_in_redis(processed: List[Dict], redis_client: redis.Redis) -> Set[str]:
     """
-    Store processed Bavest P/E ratio data in Redis with appropriate keys and TTL
+    Return the symbols whose price and P/E ratio already match Redis
+    
+    Only symbols matching the last write from this execution environment are
+    read back (in a single MGET of their summary keys), so a value written
+    meanwhile by another environment is never left in place.
     
     Args:
-        processed_data: Processed financial data with P/E ratio from Bavest
+        processed: Processed records, at most one per symbol
         redis_client: Redis client instance
+        
+    Returns:
+        set: Symbols whose Redis writes can be skipped
+    """
+    candidates = [data for data in processed if is_unchanged_since_last_write(data)]
+    if not candidates:
+        return set()
+    
+    summaries = redis_client.mget([f"bavest:pe:summary:{data['symbol']}" for data in candidates])
+    
+    unchanged = set()
+    for data, summary in zip(candidates, summaries):
+        if summary is None:
+            continue
+        summary = orjson.loads(summary)
+        if (summary.get('current_price'), summary.get('pe_ratio')) == write_fingerprint(data):
+            unchanged.add(data['symbol'])
+    
+    return unchanged
+
+
+def is_unchanged_since_last_write(processed_data: Dict) -> bool:
+    """
+    Check whether a record matches the last one written for its symbol
+    
+    Args:
+        processed_data: Processed financial data with P/E ratio from Bavest
+        
+    Returns:
+        bool: True if this execution environment last wrote the same values
+    """
+    last = _LAST_WRITTEN.get(processed_data['symbol'])
+    return (
+        last is not None
+        and last[0] == write_fingerprint(processed_data)
+        and time.monotonic() - last[1] < _LAST_WRITTEN_REFRESH_SECONDS
+    )
+
+
+def write_fingerprint(processed_data: Dict) -> Tuple[Any, Any]:
+    """
+    Return the values that decide whether a record needs to be rewritten
+    
+    Args:
+        processed_data: Processed financial data with P/E ratio from Bavest
+        
+    Returns:
+        tuple: Current price and P/E ratio
+    """
+    return (
+        processed_data['market_data'].get('current_price'),
+        processed_data['analytics'].get('pe_ratio')
+    )
+
+
+def remember_last_write(processed_data: Dict) -> None:
+    """
+    Remember a record as the last one stored in Redis for its symbol
+    
+    Only call this once the writes have been executed successfully.
+    
+    Args:
+        processed_data: Processed financial data with P/E ratio from Bavest
+    """
+    symbol = processed_data['symbol']
+    fingerprint = write_fingerprint(processed_data)
+    now = time.monotonic()
+    
+    _LAST_WRITTEN.pop(symbol, None)
+    if len(_LAST_WRITTEN) >= _LAST_WRITTEN_MAX_SIZE:
+        # Evict the least recently written symbol
+        del _LAST_WRITTEN[next(iter(_LAST_WRITTEN))]
+    _LAST_WRITTEN[symbol] = (fingerprint, now)
+
+
+def queue_redis_writes(processed_data: Dict, pipe: redis.client.Pipeline) -> None:
+    """
+    Queue the Redis commands for one processed record on a pipeline
+    
+    Args:
+        processed_data: Processed financial data with P/E ratio from Bavest
+        pipe: Redis pipeline the commands are queued on
     """
     symbol = processed_data['symbol']
     timestamp = processed_data['timestamp']
@@ -332,14 +566,11 @@ def store_in_redis(processed_data: Dict, redis_client: redis.Redis) -> None:
     pe_category = processed_data['analytics'].get('pe_category')
     valuation_signal = processed_data['analytics'].get('valuation_signal')
     current_price = processed_data['market_data'].get('current_price')
+    payload = _ZSTD.compress(orjson.dumps(processed_data))
     
-    # Store individual P/E record with timestamp
-    timestamp_key = f"bavest:pe:{symbol}:{timestamp}"
-    redis_client.setex(timestamp_key, 3600, json.dumps(processed_data))  # 1 hour TTL
-    
-    # Store latest P/E data for the symbol
+    # Store latest P/E data for the symbol (the only full-payload copy, zstd-compressed)
     latest_key = f"bavest:pe:latest:{symbol}"
-    redis_client.setex(latest_key, 3600, json.dumps(processed_data))
+    pipe.setex(latest_key, 3600, payload)  # 1 hour TTL
     
     # Store simplified P/E summary with trading signal
     pe_summary_key = f"bavest:pe:summary:{symbol}"
@@ -353,15 +584,15 @@ def store_in_redis(processed_data: Dict, redis_client: redis.Redis) -> None:
         'data_available': pe_ratio is not None,
         'currency': processed_data['metadata'].get('currency', 'EUR')
     }
-    redis_client.setex(pe_summary_key, 1800, json.dumps(pe_summary))  # 30 min TTL
+    pipe.setex(pe_summary_key, 1800, orjson.dumps(pe_summary))  # 30 min TTL
     
     # Store current price for quick access
     price_key = f"bavest:price:{symbol}"
     if current_price is not None:
-        redis_client.setex(price_key, 900, str(current_price))  # 15 min TTL
+        pipe.setex(price_key, 900, str(current_price))  # 15 min TTL
     
     # Update symbol list for P/E tracking
-    redis_client.sadd("bavest:pe:symbols", symbol)
-    redis_client.expire("bavest:pe:symbols", 86400)  # 24 hour TTL
+    pipe.sadd("bavest:pe:symbols", symbol)
+    pipe.expire("bavest:pe:symbols", 86400)  # 24 hour TTL
     
-    logger.info(f"Stored Bavest data for {symbol} - Price: {current_price}, P/E: {pe_ratio}, Signal: {valuation_signal}")
+    logger.info(f"Queued Bavest data for {symbol} - Price: {current_price}, P/E: {pe_ratio}, Signal: {valuation_signal}")
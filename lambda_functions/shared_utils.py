@@ -4,34 +4,100 @@ Shared utilities for Lambda functions
 
 import json
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+import math
+import os
+import time
+from typing import Dict, Any, Optional, Sequence
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# NumPy and msgspec are optional and slow to import, so they are only loaded
+# on first use (safe_float_array / create_response_struct and PriceBar)
+_UNSET = object()
+_numpy = _UNSET
+_msgspec = _UNSET
+_price_bar = None
+
+# Built once and shared by every setup_logging call
+_FORMATTER = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+_HANDLER = logging.StreamHandler()
+_HANDLER.setFormatter(_FORMATTER)
+_LEVEL_MAP = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'WARN': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL,
+    'FATAL': logging.FATAL,
+    'NOTSET': logging.NOTSET
+}
+
+# Headers used by the create_response* functions when none are given. The same
+# dict is returned in every such response, so callers must not mutate
+# response['headers'] in place.
+_DEFAULT_HEADERS: Dict[str, str] = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+# Type -> encoder map for _json_default, built on first use
+_default_encoders = None
+
+# Static part of the metadata added by add_timestamp_metadata
+_METADATA_TEMPLATE = {
+    'processor_version': '1.0',
+    'data_source': 'bavest_api'
+}
+
+# (epoch second, formatted second) reused by utc_timestamp within the same second
+_second_cache = (-1, '')
+
+# Field names checked by extract_symbol_from_data (in priority order) and DataValidator.
+# Identifier-like string literals are interned by the compiler already, so
+# wrapping these (or the metadata template) in sys.intern() would be a no-op.
+_SYMBOL_FIELDS = ('symbol', 'ticker', 'instrument', 'asset', 'stock')
+_PRICE_FIELDS = frozenset({'price', 'prices', 'close', 'last_price', 'current_price'})
+_SIGNAL_FIELDS = frozenset({'signal', 'signal_strength', 'signal_direction', 'recommendation'})
+_VOLUME_FIELDS = frozenset({'volume', 'volumes', 'trading_volume'})
+
+# Bit flags returned by classify_data_fields
+PRICE_DATA = 1
+SIGNAL_DATA = 2
+VOLUME_DATA = 4
+
+_FIELD_TO_MASK = (
+    {field: PRICE_DATA for field in _PRICE_FIELDS}
+    | {field: SIGNAL_DATA for field in _SIGNAL_FIELDS}
+    | {field: VOLUME_DATA for field in _VOLUME_FIELDS}
+)
 
 
 def setup_logging(level: str = "INFO") -> logging.Logger:
     """
     Setup standardized logging for Lambda functions
     
+    A single module-level handler is attached to the root logger; later
+    calls (e.g. on warm invocations) just reapply the level.
+    
     Args:
-        level: Logging level (DEBUG, INFO, WARNING, ERROR)
+        level: Logging level (any stdlib name, including the WARN and
+            FATAL aliases); unknown names fall back to INFO
         
     Returns:
         Logger instance
     """
     logger = logging.getLogger()
-    logger.setLevel(getattr(logging, level.upper()))
+    logger.setLevel(_LEVEL_MAP.get(level.upper(), logging.INFO))
     
-    # Remove existing handlers to avoid duplicates
-    for handler in logger.handlers[:]:
-        logger.removeHandler(handler)
-    
-    # Create console handler with formatting
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    if _HANDLER not in logger.handlers:
+        # Remove existing handlers to avoid duplicates
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        logger.addHandler(_HANDLER)
     
     return logger
 
@@ -48,16 +114,139 @@ def create_response(status_code: int, body: Dict[str, Any], headers: Optional[Di
     Returns:
         Lambda response dictionary
     """
-    response = {
+    return _build_response(status_code, serialize_body(body).decode('utf-8'), headers)
+
+
+def create_response_bytes(status_code: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict:
+    """Create a Lambda response for any JSON-serializable body (same as create_response)"""
+    return create_response(status_code, body, headers)
+
+
+def create_response_struct(status_code: int, body: Any, headers: Optional[Dict[str, str]] = None) -> Dict:
+    """
+    Create a Lambda response for schema-typed payloads
+    
+    msgspec generates an encoder per Struct type, so typed payloads skip
+    per-value type dispatch entirely.
+    
+    Args:
+        status_code: HTTP status code
+        body: msgspec.Struct instance (e.g. PriceBar) or a list of them
+        headers: Optional response headers
+        
+    Returns:
+        Lambda response dictionary
+        
+    Raises:
+        ImportError: If msgspec is not installed
+    """
+    msgspec = _load_msgspec()
+    if msgspec is None:
+        raise ImportError("msgspec is required for create_response_struct")
+    
+    return _build_response(status_code, msgspec.json.encode(body).decode('utf-8'), headers)
+
+
+def _build_response(status_code: int, body: str, headers: Optional[Dict[str, str]]) -> Dict:
+    """Wrap an already serialized JSON body in a Lambda response dictionary"""
+    # The Lambda runtime JSON-encodes the return value, so this must stay a
+    # plain dict (a NamedTuple would serialize as an array)
+    return {
         'statusCode': status_code,
-        'body': json.dumps(body, default=str),
-        'headers': headers or {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        }
+        'isBase64Encoded': False,
+        'body': body,
+        'headers': headers or _DEFAULT_HEADERS
     }
+
+
+def serialize_body(body: Any) -> bytes:
+    """
+    Serialize a response body to JSON bytes
     
-    return response
+    Args:
+        body: Response body
+        
+    Returns:
+        UTF-8 encoded JSON
+    """
+    if orjson is not None:
+        # orjson handles datetime/UUID/numpy natively, so the default
+        # callback only runs for types like Decimal
+        try:
+            return orjson.dumps(
+                body,
+                default=_json_default,
+                option=orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            )
+        except orjson.JSONEncodeError:
+            # Input orjson rejects but stdlib json accepts (e.g. integers
+            # beyond 64 bits); fall through to the stdlib path
+            pass
+    
+    # Normalized so the output matches orjson's: compact, unescaped UTF-8,
+    # NaN/Infinity as null and naive datetimes encoded as UTC
+    return json.dumps(
+        _normalize_for_json(body),
+        default=lambda value: _normalize_for_json(_json_default(value)),
+        allow_nan=False,
+        ensure_ascii=False,
+        separators=(',', ':')
+    ).encode('utf-8')
+
+
+def _normalize_for_json(value: Any) -> Any:
+    """Recursively convert values stdlib json would encode differently from orjson"""
+    value_type = type(value)
+    
+    if value_type is float:
+        return value if math.isfinite(value) else None
+    if value_type is dict:
+        return {_normalize_json_key(key): _normalize_for_json(item) for key, item in value.items()}
+    if value_type is list or value_type is tuple:
+        return [_normalize_for_json(item) for item in value]
+    if value_type.__module__ == 'numpy' and hasattr(value, 'tolist'):
+        # NumPy arrays and scalars, which orjson serializes natively
+        return _normalize_for_json(value.tolist())
+    
+    return value
+
+
+def _normalize_json_key(key: Any) -> Any:
+    """Convert a dict key the way orjson's OPT_NON_STR_KEYS does"""
+    key_type = type(key)
+    
+    if key_type is str or key_type is int or key_type is bool or key is None:
+        return key
+    if key_type is float:
+        return key if math.isfinite(key) else 'null'
+    
+    return _json_default(key)
+
+
+def _json_default(value: Any) -> Any:
+    """Encode types JSON doesn't support natively, dispatching on the exact type"""
+    global _default_encoders
+    
+    if _default_encoders is None:
+        # Built on first use to keep these imports off the cold-start path
+        from datetime import date, datetime, timezone
+        from decimal import Decimal
+        from uuid import UUID
+        
+        def datetime_isoformat(value: datetime) -> str:
+            # Naive datetimes are UTC, as with orjson's OPT_NAIVE_UTC
+            if value.tzinfo is None:
+                value = value.replace(tzinfo=timezone.utc)
+            return value.isoformat()
+        
+        _default_encoders = {
+            Decimal: float,
+            datetime: datetime_isoformat,
+            date: date.isoformat,
+            UUID: str
+        }
+    
+    return _default_encoders.get(type(value), str)(value)
 
 
 def validate_environment_variables(*required_vars: str) -> None:
@@ -70,12 +259,8 @@ def validate_environment_variables(*required_vars: str) -> None:
     Raises:
         ValueError: If any required variable is missing
     """
-    import os
-    
-    missing_vars = []
-    for var in required_vars:
-        if not os.environ.get(var):
-            missing_vars.append(var)
+    env = os.environ
+    missing_vars = [var for var in required_vars if not env.get(var)]
     
     if missing_vars:
         raise ValueError(f"Missing required environment variables: {', '.join(missing_vars)}")
@@ -92,12 +277,105 @@ def safe_float_conversion(value: Any, default: float = 0.0) -> float:
     Returns:
         Float value or default
     """
+    # Fast paths for already-numeric values (exact type checks skip the MRO walk)
+    value_type = type(value)
+    if value_type is float:
+        return value
+    if value_type is int:
+        return float(value)
+    if value is None:
+        return default
+    
     try:
-        return float(value) if value is not None else default
+        return float(value)
     except (ValueError, TypeError):
         return default
 
 
+def safe_float_array(values: Sequence[Any], default: float = 0.0):
+    """
+    Convert a batch of values to floats with the same fallback rules as
+    safe_float_conversion
+    
+    Args:
+        values: Values to convert
+        default: Default value for None or unconvertible entries
+        
+    Returns:
+        NumPy float64 array, or a list of floats if NumPy is not installed
+    """
+    np = _load_numpy()
+    if np is None:
+        return [safe_float_conversion(value, default) for value in values]
+    
+    try:
+        # Conversion loop runs in C when every entry is numeric or None
+        return np.fromiter(
+            (default if value is None else value for value in values),
+            dtype=np.float64,
+            count=len(values)
+        )
+    except (ValueError, TypeError):
+        # Mixed input: fall back to per-value conversion
+        return np.array(
+            [safe_float_conversion(value, default) for value in values],
+            dtype=np.float64
+        )
+
+
+def _load_numpy():
+    """Import NumPy on first use, returning None if it is not installed"""
+    global _numpy
+    
+    if _numpy is _UNSET:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - numpy is optional
+            numpy = None
+        _numpy = numpy
+    
+    return _numpy
+
+
+def _load_msgspec():
+    """Import msgspec on first use, returning None if it is not installed"""
+    global _msgspec
+    
+    if _msgspec is _UNSET:
+        try:
+            import msgspec
+        except ImportError:  # pragma: no cover - msgspec is optional
+            msgspec = None
+        _msgspec = msgspec
+    
+    return _msgspec
+
+
+def _price_bar_type():
+    """Build the PriceBar msgspec.Struct on first use"""
+    global _price_bar
+    
+    if _price_bar is None:
+        msgspec = _load_msgspec()
+        if msgspec is None:
+            raise ImportError("msgspec is required for PriceBar")
+        
+        class PriceBar(msgspec.Struct):
+            """Fixed-schema price bar for create_response_struct"""
+            
+            symbol: str
+            open: float
+            high: float
+            low: float
+            close: float
+            volume: int
+        
+        PriceBar.__qualname__ = 'PriceBar'
+        _price_bar = PriceBar
+    
+    return _price_bar
+
+
 def safe_int_conversion(value: Any, default: int = 0) -> int:
     """
     Safely convert value to int with fallback
@@ -109,8 +387,14 @@ def safe_int_conversion(value: Any, default: int = 0) -> int:
     Returns:
         Integer value or default
     """
+    # Fast path for values that are already ints
+    if type(value) is int:
+        return value
+    if value is None:
+        return default
+    
     try:
-        return int(value) if value is not None else default
+        return int(value)
     except (ValueError, TypeError):
         return default
 
@@ -125,13 +409,33 @@ def extract_symbol_from_data(data: Dict[str, Any]) -> str:
     Returns:
         Trading symbol or 'UNKNOWN'
     """
-    symbol_fields = ['symbol', 'ticker', 'instrument', 'asset', 'stock']
+    # One dict lookup per field; stops at the first truthy value. str.upper()
+    # already has an ASCII fast path and beats a str.translate table (~35ns vs
+    # ~160ns for a 4-char ticker), while also handling non-ASCII correctly.
+    return next(
+        (str(value).upper() for field in _SYMBOL_FIELDS if (value := data.get(field))),
+        'UNKNOWN'
+    )
+
+
+def utc_timestamp() -> str:
+    """
+    Return the current UTC time as an ISO 8601 string with a 'Z' suffix
+    
+    The formatted seconds are cached, so strftime only runs once per second.
+    
+    Returns:
+        Timestamp such as 2024-01-01T12:00:00.123456Z
+    """
+    global _second_cache
     
-    for field in symbol_fields:
-        if field in data and data[field]:
-            return str(data[field]).upper()
+    seconds, nanoseconds = divmod(time.time_ns(), 1_000_000_000)
+    cached_seconds, formatted = _second_cache
+    if seconds != cached_seconds:
+        formatted = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds))
+        _second_cache = (seconds, formatted)
     
-    return 'UNKNOWN'
+    return f"{formatted}.{nanoseconds // 1000:06d}Z"
 
 
 def add_timestamp_metadata(data: Dict[str, Any]) -> Dict[str, Any]:
@@ -144,13 +448,7 @@ def add_timestamp_metadata(data: Dict[str, Any]) -> Dict[str, Any]:
     Returns:
         Data with added timestamp metadata
     """
-    timestamp = datetime.utcnow().isoformat()
-    
-    metadata = {
-        'processed_at': timestamp,
-        'processor_version': '1.0',
-        'data_source': 'bavest_api'
-    }
+    metadata = {'processed_at': utc_timestamp(), **_METADATA_TEMPLATE}
     
     if isinstance(data, dict):
         data['metadata'] = metadata
@@ -158,23 +456,58 @@ def add_timestamp_metadata(data: Dict[str, Any]) -> Dict[str, Any]:
     return data
 
 
+# The validators check the key view against the field set: the C-level
+# isdisjoint iterates whichever side is smaller, so the cost stays constant
+# however wide the API response is (and it avoids building the set that
+# `_PRICE_FIELDS & data.keys()` would allocate)
+def is_valid_price_data(data: Dict[str, Any]) -> bool:
+    """Validate price data structure"""
+    return not data.keys().isdisjoint(_PRICE_FIELDS)
+
+
+def is_valid_signal_data(data: Dict[str, Any]) -> bool:
+    """Validate signal data structure"""
+    return not data.keys().isdisjoint(_SIGNAL_FIELDS)
+
+
+def is_valid_volume_data(data: Dict[str, Any]) -> bool:
+    """Validate volume data structure"""
+    return not data.keys().isdisjoint(_VOLUME_FIELDS)
+
+
+def classify_data_fields(data: Dict[str, Any]) -> int:
+    """
+    Check the price, signal and volume validators in a single pass over the keys
+    
+    Args:
+        data: Financial data dictionary
+        
+    Returns:
+        Bitmask of PRICE_DATA, SIGNAL_DATA and VOLUME_DATA, e.g.
+        ``classify_data_fields(data) & PRICE_DATA`` matches is_valid_price_data
+    """
+    mask = 0
+    for field in data:
+        mask |= _FIELD_TO_MASK.get(field, 0)
+    return mask
+
+
 class DataValidator:
-    """Helper class for data validation"""
-    
-    @staticmethod
-    def is_valid_price_data(data: Dict[str, Any]) -> bool:
-        """Validate price data structure"""
-        price_fields = ['price', 'prices', 'close', 'last_price', 'current_price']
-        return any(field in data for field in price_fields)
-    
-    @staticmethod
-    def is_valid_signal_data(data: Dict[str, Any]) -> bool:
-        """Validate signal data structure"""
-        signal_fields = ['signal', 'signal_strength', 'signal_direction', 'recommendation']
-        return any(field in data for field in signal_fields)
-    
-    @staticmethod
-    def is_valid_volume_data(data: Dict[str, Any]) -> bool:
-        """Validate volume data structure"""
-        volume_fields = ['volume', 'volumes', 'trading_volume']
-        return any(field in data for field in volume_fields)
+    """Helper class for data validation (kept for existing call sites; prefer the module-level functions)"""
+    
+    __slots__ = ()
+    
+    is_valid_price_data = staticmethod(is_valid_price_data)
+    is_valid_signal_data = staticmethod(is_valid_signal_data)
+    is_valid_volume_data = staticmethod(is_valid_volume_data)
+
+
+def __getattr__(name: str) -> Any:
+    """Lazily provide module attributes that are no longer imported at load time (PEP 562)"""
+    if name == 'datetime':
+        from datetime import datetime
+        return datetime
+    if name == 'PriceBar':
+        return _price_bar_type()
+    
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")